@@ -5,22 +5,31 @@ DATA PIPELINE MVP для X5 Tech
 """
 
 import pandas as pd
-import sqlite3
-import json
+import polars as pl
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+import duckdb
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 
+SEP = "=" * 70
+
 def main():
-    print("=" * 70)
+    print(SEP)
     print("🎯 DATA PIPELINE MVP для X5 Tech")
     print("   (Демонстрация концепций Trino, Iceberg, MinIO, Flink)")
-    print("=" * 70)
+    print(SEP)
     
     # 0. Проверка данных
     print("\n📊 ШАГ 0: Проверка входных данных")
     csv_file = "retail_sales.csv"
     
-    if not os.path.exists(csv_file):
+    try:
+        os.stat(csv_file)
+    except FileNotFoundError:
         print(f"   ❌ Файл {csv_file} не найден!")
         print("   📝 Создаю тестовые данные для демонстрации...")
         create_sample_data()
@@ -28,47 +37,74 @@ def main():
         print(f"   ✅ Файл найден: {csv_file}")
     
     # 1. ИМИТАЦИЯ: Источник данных (кассы магазинов)
-    print("\n" + "=" * 70)
+    print("\n" + SEP)
     print("1. 📥 ИСТОЧНИК ДАННЫХ")
     print("   - CSV файл с продажами (аналог потока с касс X5)")
     print("   - Формат: OrderID, Date, Product, Category, Sales, Profit")
     
-    df = pd.read_csv(csv_file, encoding='windows-1251')
-    print(f"   ✅ Загружено: {len(df):,} строк, {len(df.columns)} колонок")
+    # Многопоточный парсер Arrow с явной схемой для ключевых колонок.
+    # Читаем только колонки, нужные для агрегации; остальные не материализуются.
+    # Ключи группировки читаем как словарь: группировка идет по кодам int32 вместо строк,
+    # в String переводятся только агрегированные строки
+    dict_string = pa.dictionary(pa.int32(), pa.string())
+    table = pacsv.read_csv(
+        csv_file,
+        read_options=pacsv.ReadOptions(encoding='windows-1251', block_size=8 << 20),
+        parse_options=pacsv.ParseOptions(delimiter=','),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=['Order Date', 'Category', 'Region', 'Sales', 'Profit', 'Quantity', 'Order ID'],
+            column_types={
+                'Order ID': dict_string,
+                'Order Date': pa.string(),
+                'Category': dict_string,
+                'Region': dict_string,
+                'Sales': pa.float64(),
+                'Profit': pa.float64(),
+                'Quantity': pa.int32()
+            }
+        )
+    )
     
-    # Преобразование дат
-    df['Order Date'] = pd.to_datetime(df['Order Date'], format='%m/%d/%Y')
+    print(f"   ✅ Загружено: {table.num_rows:,} строк, {table.num_columns} колонок")
     
     # 2. ИМИТАЦИЯ: Apache Flink (потоковая обработка)
-    print("\n" + "=" * 70)
+    print("\n" + SEP)
     print("2. ⚡ APACHE FLINK - ПОТОКОВАЯ ОБРАБОТКА")
     print("   - Оконная агрегация (tumbling window по дням)")
     print("   - Группировка по категориям и регионам")
     print("   - Расчет метрик в реальном времени")
     
-    # Агрегация как во Flink
-    df['order_day'] = df['Order Date'].dt.date
-    
-    daily_agg = df.groupby(['order_day', 'Category', 'Region']).agg({
-        'Sales': ['sum', 'mean'],
-        'Profit': ['sum', 'mean'],
-        'Quantity': 'sum',
-        'Order ID': 'nunique'
-    }).reset_index()
-    
-    # Упрощаем названия колонок
-    daily_agg.columns = [
-        'date', 'category', 'region',
-        'total_sales', 'avg_sales',
-        'total_profit', 'avg_profit',
-        'total_quantity', 'unique_orders'
-    ]
+    # Агрегация как во Flink: ленивый план Polars (дата + группировка + метрики за один проход).
+    # Polars читает буферы Arrow напрямую, без промежуточного pandas DataFrame
+    lf = (
+        pl.from_arrow(table).lazy()
+        # Строка даты разбирается сразу в date; cache=True парсит каждую уникальную дату один раз
+        .with_columns(pl.col('Order Date').str.to_date('%m/%d/%Y', cache=True).alias('date'))
+        # Ключи сразу получают итоговые имена - переименование после collect не нужно
+        .group_by(['date', pl.col('Category').alias('category'), pl.col('Region').alias('region')])
+        .agg([
+            pl.col('Sales').sum().alias('total_sales'),
+            pl.col('Sales').mean().alias('avg_sales'),
+            pl.col('Profit').sum().alias('total_profit'),
+            pl.col('Profit').mean().alias('avg_profit'),
+            pl.col('Quantity').cast(pl.Int64).sum().alias('total_quantity'),
+            pl.col('Order ID').to_physical().n_unique().cast(pl.Int64).alias('unique_orders')
+        ])
+        # Categorical -> String уже на агрегатах, чтобы внутренние метаданные Polars не попадали в Parquet
+        .with_columns(pl.col('category', 'region').cast(pl.String))
+        .sort(['date', 'category', 'region'])
+    )
+    
+    # Одна таблица Arrow обслуживает все приемники (Parquet, CSV, DuckDB);
+    # pandas-представление строится из тех же буферов только для итоговой статистики
+    agg_table = lf.collect(engine='streaming').to_arrow()
+    daily_agg = agg_table.to_pandas(types_mapper=pd.ArrowDtype)
     
     print(f"   ✅ Агрегировано: {len(daily_agg):,} записей")
     print(f"   📈 Метрики: выручка, прибыль, количество, уникальные заказы")
     
     # 3. ИМИТАЦИЯ: Apache Iceberg (табличный формат)
-    print("\n" + "=" * 70)
+    print("\n" + SEP)
     print("3. 🧊 APACHE ICEBERG - ХРАНЕНИЕ ДАННЫХ")
     print("   - ACID-транзакции (в production)")
     print("   - Time travel queries (доступ к историческим данным)")
@@ -89,7 +125,7 @@ def main():
         ],
         "properties": {
             "write.format.default": "parquet",
-            "write.parquet.compression-codec": "snappy"
+            "write.parquet.compression-codec": "zstd"
         }
     }
     
@@ -97,93 +133,54 @@ def main():
     print(f"   📍 Локация: {iceberg_metadata['location']}")
     
     # Сохраняем метаданные
-    with open('iceberg_metadata.json', 'w') as f:
-        json.dump(iceberg_metadata, f, indent=2)
+    with open('iceberg_metadata.json', 'wb') as f:
+        f.write(orjson.dumps(iceberg_metadata, option=orjson.OPT_INDENT_2))
     
     # 4. ИМИТАЦИЯ: MinIO/S3 (объектное хранилище)
-    print("\n" + "=" * 70)
+    print("\n" + SEP)
     print("4. 🗄️ MINIO / S3 - ОБЪЕКТНОЕ ХРАНИЛИЩЕ")
     print("   - Аналог AWS S3 для локальной разработки")
     print("   - Хранение данных в формате Parquet")
     print("   - Масштабируемость и отказоустойчивость")
     
     # Сохраняем в Parquet (формат который использует Iceberg)
-    daily_agg.to_parquet('sales_daily.parquet', compression='snappy', index=False)
+    parquet_size = write_parquet(agg_table, 'sales_daily.parquet')
     
-    print(f"   ✅ Данные сохранены в Parquet (сжатие: snappy)")
-    print(f"   📊 Размер файла: {os.path.getsize('sales_daily.parquet') / 1024:.1f} KB")
+    print(f"   ✅ Данные сохранены в Parquet (сжатие: zstd)")
+    print(f"   📊 Размер файла: {parquet_size / 1024:.1f} KB")
     
     # 5. ИМИТАЦИЯ: Trino (распределенный SQL)
-    print("\n" + "=" * 70)
+    print("\n" + SEP)
     print("5. 🗃️ TRINO - РАСПРЕДЕЛЕННЫЙ SQL ДВИЖОК")
     print("   - Единая точка доступа к данным")
     print("   - SQL-интерфейс для аналитиков")
     print("   - Запросы к данным в Iceberg таблицах")
     
-    # Используем SQLite для имитации SQL-запросов Trino
-    conn = sqlite3.connect(':memory:')
-    daily_agg.to_sql('sales_daily', conn, index=False, if_exists='replace')
+    # Создаем папку output
+    os.makedirs('output', exist_ok=True)
     
-    # Примеры аналитических запросов (как в Trino)
-    queries = [
-        {
-            "name": "Топ-5 категорий по выручке",
-            "sql": """
-                SELECT 
-                    category,
-                    ROUND(SUM(total_sales), 2) as revenue,
-                    ROUND(SUM(total_profit), 2) as profit,
-                    ROUND(SUM(total_profit) / SUM(total_sales) * 100, 2) as margin_percent
-                FROM sales_daily 
-                GROUP BY category 
-                ORDER BY revenue DESC 
-                LIMIT 5
-            """
-        },
-        {
-            "name": "Динамика продаж по дням",
-            "sql": """
-                SELECT 
-                    date,
-                    SUM(total_sales) as daily_revenue,
-                    SUM(total_quantity) as daily_items,
-                    COUNT(*) as records_count
-                FROM sales_daily 
-                GROUP BY date 
-                ORDER BY date DESC
-                LIMIT 7
-            """
-        },
-        {
-            "name": "Регионы с наибольшей маржой",
-            "sql": """
-                SELECT 
-                    region,
-                    ROUND(SUM(total_sales), 2) as revenue,
-                    ROUND(SUM(total_profit), 2) as profit,
-                    ROUND(SUM(total_profit) / SUM(total_sales) * 100, 2) as margin_percent
-                FROM sales_daily 
-                GROUP BY region 
-                HAVING revenue > 0
-                ORDER BY margin_percent DESC 
-                LIMIT 3
-            """
-        }
-    ]
+    # Файлы output/ пишутся в фоне, пока DuckDB выполняет запросы в основном потоке (Arrow и DuckDB отпускают GIL)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # CSV пишет C++-писатель Arrow из той же таблицы, что и Parquet (без повторной конвертации pandas -> Arrow)
+        csv_future = executor.submit(
+            pacsv.write_csv, agg_table, 'output/daily_sales_aggregated.csv',
+            write_options=pacsv.WriteOptions(include_header=True, delimiter=',')
+        )
+        parquet_future = executor.submit(write_parquet, agg_table, 'output/daily_sales_aggregated.parquet')
+        query_results = run_queries(agg_table)
     
     print("\n   📊 РЕЗУЛЬТАТЫ АНАЛИТИЧЕСКИХ ЗАПРОСОВ:")
     
-    for i, query in enumerate(queries, 1):
-        result = pd.read_sql_query(query["sql"], conn)
-        print(f"\n   {i}. {query['name']}:")
+    for i, (name, result) in enumerate(query_results, 1):
+        print(f"\n   {i}. {name}:")
         if not result.empty:
-            for _, row in result.iterrows():
-                print(f"      • {row.iloc[0]}: {row.iloc[1]:.2f} ({row.iloc[2]:.2f} прибыль)")
-    
-    conn.close()
+            print("\n".join(
+                f"      • {vals[0]}: {vals[1]:.2f} ({vals[2]:.2f} прибыль)"
+                for vals in result.itertuples(index=False, name=None)
+            ))
     
     # 6. БИЗНЕС-ИНСАЙТЫ для X5
-    print("\n" + "=" * 70)
+    print("\n" + SEP)
     print("6. 📈 БИЗНЕС-ИНСАЙТЫ ДЛЯ РИТЕЙЛА (X5 Group)")
     
     insights = [
@@ -198,34 +195,41 @@ def main():
         print(f"   {insight}")
     
     # 7. Сохранение результатов
-    print("\n" + "=" * 70)
+    print("\n" + SEP)
     print("7. 💾 СОХРАНЕНИЕ РЕЗУЛЬТАТОВ")
     
-    # Создаем папку output
-    os.makedirs('output', exist_ok=True)
-    
-    # Сохраняем все файлы
-    daily_agg.to_csv('output/daily_sales_aggregated.csv', index=False)
-    daily_agg.to_parquet('output/daily_sales_aggregated.parquet', index=False)
+    # Файлы уже записаны в фоне на шаге 5; result() пробрасывает ошибки записи
+    csv_future.result()
+    parquet_future.result()
+    
+    # Итоговые показатели считаем один раз: они нужны и в README, и в консольной статистике
+    stats = {
+        'aggregations': len(daily_agg),
+        'date_range': f"{daily_agg['date'].min()} - {daily_agg['date'].max()}",
+        'categories': daily_agg['category'].nunique(),
+        'regions': daily_agg['region'].nunique(),
+        'total_sales': daily_agg['total_sales'].sum(),
+        'total_profit': daily_agg['total_profit'].sum()
+    }
     
     # Создаем README с результатами
-    create_readme(daily_agg)
+    create_readme(stats)
     
     print("   ✅ daily_sales_aggregated.csv - агрегированные данные")
     print("   ✅ daily_sales_aggregated.parquet - данные в формате Iceberg")
     print("   ✅ iceberg_metadata.json - метаданные таблицы Iceberg")
     print("   ✅ output/README.md - отчет с результатами")
     
-    print("\n" + "=" * 70)
+    print("\n" + SEP)
     print("✅ КОНВЕЙЕР УСПЕШНО ЗАВЕРШЕН!")
     print("\n📋 ИТОГОВАЯ СТАТИСТИКА:")
-    print(f"   • Обработано транзакций: {len(df):,}")
-    print(f"   • Создано агрегаций: {len(daily_agg):,}")
-    print(f"   • Категорий товаров: {daily_agg['category'].nunique()}")
-    print(f"   • Регионов: {daily_agg['region'].nunique()}")
-    print(f"   • Диапазон дат: {daily_agg['date'].min()} - {daily_agg['date'].max()}")
-    print(f"   • Общая выручка: {daily_agg['total_sales'].sum():.2f}")
-    print(f"   • Общая прибыль: {daily_agg['total_profit'].sum():.2f}")
+    print(f"   • Обработано транзакций: {table.num_rows:,}")
+    print(f"   • Создано агрегаций: {stats['aggregations']:,}")
+    print(f"   • Категорий товаров: {stats['categories']}")
+    print(f"   • Регионов: {stats['regions']}")
+    print(f"   • Диапазон дат: {stats['date_range']}")
+    print(f"   • Общая выручка: {stats['total_sales']:.2f}")
+    print(f"   • Общая прибыль: {stats['total_profit']:.2f}")
     
     print("\n🎯 ДЛЯ СОБЕСЕДОВАНИЯ В X5 TECH:")
     print("   1. Показан полный цикл данных от источника до аналитики")
@@ -233,43 +237,155 @@ def main():
     print("   3. Предложены бизнес-инсайты для розничной сети")
     print("   4. Код готов для GitHub портфолио")
     
-    print("\n" + "=" * 70)
+    print("\n" + SEP)
 
 def create_sample_data():
     """Создает тестовые данные если CSV файл не найден"""
     import numpy as np
     
-    # Генерируем тестовые данные
-    np.random.seed(42)
+    # Генерируем тестовые данные (все колонки из одного генератора)
+    rng = np.random.default_rng(42)
     n_rows = 1000
     
+    # Строковые колонки собираем векторно в numpy, без f-строк на каждую строку
+    ids = np.arange(1, n_rows + 1)
+    order_ids = np.char.add('CA-2024-', np.char.zfill(ids.astype('U6'), 6))
+    
+    # Почасовые метки -> компоненты даты (арифметика datetime64) -> строки 'MM/DD/YYYY'
+    days = (np.datetime64('2024-01-01T00', 'h') + np.arange(n_rows)).astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = days.astype('datetime64[Y]')
+    mm = np.char.zfill(((months - years).astype(int) + 1).astype('U2'), 2)
+    dd = np.char.zfill(((days - months).astype(int) + 1).astype('U2'), 2)
+    yyyy = (years.astype(int) + 1970).astype('U4')
+    order_dates = np.char.add(np.char.add(mm, '/'), np.char.add(np.char.add(dd, '/'), yyyy))
+    
+    customer_ids = np.char.add('CG-', rng.integers(10000, 20000, n_rows).astype('U5'))
+    
+    categories = np.array(['Furniture', 'Technology', 'Office Supplies'])
+    sub_categories = np.array(['Chairs', 'Phones', 'Paper', 'Binders'])
+    regions = np.array(['South', 'West', 'Central', 'East'])
+    
     data = {
-        'Row ID': range(1, n_rows + 1),
-        'Order ID': [f'CA-2024-{i:06d}' for i in range(1, n_rows + 1)],
-        'Order Date': pd.date_range('2024-01-01', periods=n_rows, freq='h').strftime('%m/%d/%Y'),
-        'Customer ID': [f'CG-{np.random.randint(10000, 20000)}' for _ in range(n_rows)],
-        'Category': np.random.choice(['Furniture', 'Technology', 'Office Supplies'], n_rows),
-        'Sub-Category': np.random.choice(['Chairs', 'Phones', 'Paper', 'Binders'], n_rows),
-        'Region': np.random.choice(['South', 'West', 'Central', 'East'], n_rows),
-        'Sales': np.random.uniform(10, 1000, n_rows).round(2),
-        'Profit': np.random.uniform(-50, 300, n_rows).round(2),
-        'Quantity': np.random.randint(1, 10, n_rows)
+        'Row ID': ids,
+        'Order ID': order_ids,
+        'Order Date': order_dates,
+        'Customer ID': customer_ids,
+        'Category': categories[rng.integers(0, len(categories), n_rows)],
+        'Sub-Category': sub_categories[rng.integers(0, len(sub_categories), n_rows)],
+        'Region': regions[rng.integers(0, len(regions), n_rows)],
+        'Sales': rng.uniform(10, 1000, n_rows).round(2),
+        'Profit': rng.uniform(-50, 300, n_rows).round(2),
+        'Quantity': rng.integers(1, 10, n_rows, dtype=np.int16)
     }
     
     df = pd.DataFrame(data)
     df.to_csv('retail_sales.csv', index=False)
     print(f"   ✅ Создано тестовых данных: {n_rows} строк")
 
-def create_readme(df):
-    """Создает README файл с результатами"""
-    # Рассчитываем все значения заранее
-    total_transactions = len(df)
-    date_range = f"{df['date'].min()} - {df['date'].max()}"
-    categories_count = df['category'].nunique()
-    regions_count = df['region'].nunique()
-    total_sales_sum = df['total_sales'].sum()
-    total_profit_sum = df['total_profit'].sum()
-    avg_margin = (total_profit_sum / total_sales_sum * 100).round(2) if total_sales_sum > 0 else 0.0
+def run_queries(table):
+    """Выполняет аналитические запросы в DuckDB и возвращает список (название, результат)"""
+    # Используем DuckDB для имитации SQL-запросов Trino (колоночный движок, читает таблицу Arrow без копирования)
+    conn = duckdb.connect()
+    conn.register('sales_daily', table)
+    
+    # Один проход по sales_daily: суммы и маржа сразу по трем срезам (категория, день, регион)
+    conn.execute("""
+        CREATE TEMP TABLE sales_rollup AS
+        SELECT 
+            CASE
+                WHEN GROUPING(category) = 0 THEN 'category'
+                WHEN GROUPING(date) = 0 THEN 'date'
+                ELSE 'region'
+            END as grouping_set,
+            category,
+            date,
+            region,
+            SUM(total_sales) as revenue,
+            SUM(total_profit) as profit,
+            SUM(total_quantity) as items,
+            COUNT(*) as records_count,
+            ROUND(SUM(total_profit) / NULLIF(SUM(total_sales), 0) * 100, 2) as margin_percent
+        FROM sales_daily 
+        GROUP BY GROUPING SETS ((category), (date), (region))
+    """)
+    
+    # Примеры аналитических запросов (как в Trino) - читают готовые срезы
+    queries = [
+        {
+            "name": "Топ-5 категорий по выручке",
+            "sql": """
+                SELECT 
+                    category,
+                    ROUND(revenue, 2) as revenue,
+                    ROUND(profit, 2) as profit,
+                    margin_percent
+                FROM sales_rollup 
+                WHERE grouping_set = 'category'
+                ORDER BY revenue DESC 
+                LIMIT 5
+            """
+        },
+        {
+            "name": "Динамика продаж по дням",
+            "sql": """
+                SELECT 
+                    date,
+                    revenue as daily_revenue,
+                    items as daily_items,
+                    records_count
+                FROM sales_rollup 
+                WHERE grouping_set = 'date'
+                ORDER BY date DESC
+                LIMIT 7
+            """
+        },
+        {
+            "name": "Регионы с наибольшей маржой",
+            "sql": """
+                SELECT 
+                    region,
+                    ROUND(revenue, 2) as revenue,
+                    ROUND(profit, 2) as profit,
+                    margin_percent
+                FROM sales_rollup 
+                WHERE grouping_set = 'region' AND revenue > 0
+                ORDER BY margin_percent DESC 
+                LIMIT 3
+            """
+        }
+    ]
+    
+    results = [
+        (query["name"], conn.execute(query["sql"]).df(date_as_object=True))
+        for query in queries
+    ]
+    conn.close()
+    return results
+
+def write_parquet(table, path):
+    """Записывает таблицу Arrow в Parquet с настройками для быстрого чтения и возвращает размер файла в байтах"""
+    with pa.OSFile(path, 'wb') as sink:
+        pq.write_table(
+            table, sink,
+            compression='zstd',
+            compression_level=3,
+            use_dictionary=['category', 'region'],
+            row_group_size=64_000,
+            data_page_size=1 << 20,
+            write_statistics=True
+        )
+        return sink.tell()
+
+def create_readme(stats):
+    """Создает README файл с результатами по заранее посчитанной статистике"""
+    total_transactions = stats['aggregations']
+    date_range = stats['date_range']
+    categories_count = stats['categories']
+    regions_count = stats['regions']
+    total_sales_sum = stats['total_sales']
+    total_profit_sum = stats['total_profit']
+    avg_margin = round(total_profit_sum / total_sales_sum * 100, 2) if total_sales_sum > 0 else 0.0
     
     # Создаем README с помощью обычных строк
     readme_content = "\n".join([